@@ -11,6 +11,8 @@ from markovnode import MarkovNode
 
 
 class Generator:
+	transcriptCache = dict() #Maps a transcripts directory to the ( speaker, dialog ) pairs found in it. Every character's generator reads the same transcripts, so this way they only get read from disk once.
+	
 	def __init__( self, charLabel, cm = "//", randomizeCapitals = False ):
 		'''Just does what the name implies.
 			Args:
@@ -45,13 +47,14 @@ class Generator:
 		else:
 			six.print_( "Character " + self.charLabel + " has a total of " + str( self.numInputWords ) + " words." )
 	
-	def buildGraph( self, inDir ):
-		'''Build the Markov graph for this generator's comic character.
+	def readTranscripts( self, transcriptDir ):
+		'''Read every line of dialog from every transcript.
 			Args:
-				inDir: The directory in which to find the 'transcripts' subdirectory. The 'transcripts' subdirectory is where we will actually look for everything.
+				transcriptDir: The directory containing the transcript files.
+			Returns:
+				A list of ( speaker, dialog ) tuples, where speaker is an upper-case character label and dialog is a list of words.
 		'''
-		transcriptDir = os.path.join( inDir, "transcripts" )
-		
+		result = []
 		for inFileName in os.listdir( transcriptDir ):
 			inFileName = os.path.join( transcriptDir, inFileName )
 			inFile = open( inFileName, mode="rt" )
@@ -66,11 +69,25 @@ class Generator:
 				if( len( line ) > 0 ):
 					line = line.split()
 					speaker = line[ 0 ].rstrip(":").strip()
-					if speaker.upper() == self.charLabel:
-						dialog = line[1:]
-						self.lines.append( dialog )
+					result.append( ( speaker.upper(), line[1:] ) )
 			
 			inFile.close()
+		
+		return result
+	
+	def buildGraph( self, inDir ):
+		'''Build the Markov graph for this generator's comic character.
+			Args:
+				inDir: The directory in which to find the 'transcripts' subdirectory. The 'transcripts' subdirectory is where we will actually look for everything.
+		'''
+		transcriptDir = os.path.join( inDir, "transcripts" )
+		
+		if transcriptDir not in Generator.transcriptCache:
+			Generator.transcriptCache[ transcriptDir ] = self.readTranscripts( transcriptDir )
+		
+		for speaker, dialog in Generator.transcriptCache[ transcriptDir ]:
+			if speaker == self.charLabel:
+				self.lines.append( dialog )
 			
 		self.nodes = dict()
 		self.sentenceStarts = []
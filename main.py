@@ -5,10 +5,32 @@ __version__ = "0.9"
 #I feel almost done with this, so 0.9 for now. I'll probably change it to 1.0 if/when I figure out how to share images with other apps.
 
 import six
+from collections import OrderedDict
+import csv
 import getopt
+import io
+import itertools
+import math
 import os
 import random
+import subprocess
 import sys
+try:
+	from os import scandir
+except ImportError: #os.scandir() was added in Python 3.5
+	scandir = None
+try:
+	import multiprocessing
+except ImportError: #Some platforms, Android among them, ship without it
+	multiprocessing = None
+try:
+	from concurrent.futures import ThreadPoolExecutor
+except ImportError: #concurrent.futures is only in Python 2 if the futures backport is installed
+	ThreadPoolExecutor = None
+try:
+	from shutil import which
+except ImportError: #shutil.which() was added in Python 3.3
+	from distutils.spawn import find_executable as which
 
 from PIL import Image, ImageDraw, ImageFont, ImageStat
 from PIL.PngImagePlugin import PngInfo
@@ -36,6 +58,86 @@ EX_NOINPUT = 66 #Input not openable
 EX_CANTCREAT = 73 #Can't create output file
 EX_NOPERM = 77 #Permission error
 
+#Font styles (lower case) which findSuitableFont() treats as neither bold nor light
+NORMAL_FONT_STYLES = frozenset( [ "medium", "regular", "normal" ] )
+
+#The PNG text chunks the transcript gets saved under, with each key's UTF-8 form for iTXt already worked out. GIMP only recognizes comments, hence the second key.
+PNG_TRANSCRIPT_KEYS = ( ( "transcript", b"transcript" ), ( "Comment", b"Comment" ) )
+
+#The MarkovApp whose comics the worker processes generate. The workers are forked from the main process, so they each inherit their own copy of it rather than having it pickled and sent over.
+workerApp = None
+
+def generateComicInWorker( generatedComicNumber ):
+	'''Generate one comic in a worker process.
+		Args:
+			generatedComicNumber: Which comic this is, counting from 0.
+		Returns:
+			An exit status. A worker which calls sys.exit() would otherwise never report back, leaving the main process waiting forever.
+	'''
+	try:
+		workerApp.generateComic( generatedComicNumber )
+	except SystemExit as error:
+		return error.code
+	return EX_OK
+
+class UnprintableCharacters( dict ):
+	'''A table for str.translate() which deletes unprintable characters. Characters get looked up and added the first time they're seen, rather than building a table of all of Unicode up front.
+	'''
+	def __missing__( self, codePoint ):
+		if six.unichr( codePoint ).isprintable():
+			self[ codePoint ] = codePoint
+		else:
+			self[ codePoint ] = None
+		return self[ codePoint ]
+
+unprintableCharacters = UnprintableCharacters()
+
+#The bytes which removeUnprintable() deletes from byte strings
+UNPRINTABLE_BYTES = bytes( bytearray( [ byte for byte in range( 256 ) if chr( byte ) not in string.printable ] ) )
+
+def removeUnprintable( text ):
+	'''Remove unprintable characters from a string.
+		Args:
+			text: A unicode or byte string.
+		Returns:
+			A string of the same type, without the unprintable characters.
+	'''
+	if isinstance( text, bytes ): #Byte strings' translate() doesn't take a dictionary, but it can delete a set of bytes. This is what Python 2's str is.
+		return text.translate( None, UNPRINTABLE_BYTES )
+	if six.PY2: #Python 2's unicode has no isprintable()
+		return u"".join( [ ch for ch in text if ch in string.printable ] )
+	return text.translate( unprintableCharacters )
+
+def quantizeForWeb( image ):
+	'''Reduce an image to a palette of at most 256 colors, for saving as a small PNG.
+		Args:
+			image: A PIL image, in any mode.
+		Returns:
+			A palette-based ("P" mode) image.
+	'''
+	if image.mode not in ( "L", "RGB", "RGBA" ): #The only modes all the quantizers below accept
+		if image.mode.endswith( ( "A", "a" ) ): #LA, PA, RGBa and the like have alpha (LAB's A is a color channel)
+			image = image.convert( mode = "RGBA" )
+		else:
+			image = image.convert( mode = "RGB" )
+	
+	colorCount = 256
+	colors = image.getcolors( maxcolors=256 ) #None if the image has more colors than that
+	if colors is not None:
+		colorCount = len( colors ) #Don't pad the palette out with entries nothing uses
+	try:
+		return image.quantize( colors=colorCount, method=Image.LIBIMAGEQUANT, dither=Image.FLOYDSTEINBERG ) #libimagequant picks a far better palette than convert() does, well enough that dithering helps rather than hurts.
+	except ( AttributeError, TypeError, ValueError ): #Pillow was built without libimagequant, or is too old to have it (Image.LIBIMAGEQUANT was added in 3.3) or quantize()'s dither argument (added in 5.0)
+		pass
+	try:
+		return image.quantize( colors=colorCount, method=Image.FASTOCTREE, dither=Image.NONE ) #Several times faster than convert()'s median cut, and its palettes compress better too
+	except ( TypeError, ValueError ): #Older Pillows' quantize() has no dither argument
+		pass
+	try:
+		return image.convert( mode = "P", palette=Image.ADAPTIVE, colors=colorCount, dither=False ) #Try turning dithering on or off.
+	except ValueError: #The adaptive palette doesn't handle alpha in every version of Pillow; the web palette handles anything
+		return image.convert( mode = "P", palette=Image.WEB, dither=False )
+
 class MarkovApp( App ):
 	
 	class MarkovGUI( Widget ):
@@ -67,9 +169,16 @@ class MarkovApp( App ):
 		self.outImageFileName = self.outImageFileNameDefault = "default out.png"
 		self.numberOfComics = self.numberOfComicsDefault = 1
 		self.saveForWeb = self.saveForWebDefault = False
+		self.optimizePNG = self.optimizePNGDefault = False #Pillow's optimize tries the slowest zlib settings. It makes web images about a fifth smaller, at several times the cost of the save.
+		self.compressLevel = self.compressLevelDefault = 6 #zlib level for normal saves. Going from 6 to 9 takes about five times as long for only a couple percent smaller files.
+		self.oxipng = which( "oxipng" ) #The path to oxipng if it's installed, else None. It does optimizePNG's job better and faster than Pillow does.
 		self.commentMark = self.commentMarkDefault = "}}" #If in the future we decide to use a different mark for comments, this is the only line we'll need to change.
 		self.commandLineFont = None #If a font file is specified on the command line, this will be set.
 		self.topImageFileName = None
+		self.originalURLs = None #Maps comic IDs to the URLs in sources.tsv, filled in by getOriginalURL()
+		self.topImage = None #The top image as loaded from topImageFileName, filled in by getTopImage()
+		self.topImages = dict() #Maps modes to copies of the top image converted to that mode
+		self.splitFileNames = dict() #Maps output file names to their ( name, extension ) pairs, which numberedFileName() puts comic numbers between
 		self.randomizeCapitals = self.randomizeCapitalsDefault = False
 		self.WordPressURI = self.WordPressURIDefault = None
 		self.loginName = self.loginNameDefault = None
@@ -83,20 +192,29 @@ class MarkovApp( App ):
 		self.fontsDir = os.path.join( self.inDir, "fonts" )
 		self.imageDir = os.path.join( self.inDir, "images" )
 		
+		self.localFonts = None #The fonts found in fontsDir, filled in by scanFontsDir()
+		self.suitableFonts = dict() #Maps findSuitableFont()'s arguments to its results
 		self.normalFontFile = self.findSuitableFont( preferBold = False, preferNormal = True )
 		self.boldFontFile = self.findSuitableFont( preferBold = True, preferNormal = False )
 		
-		self.blogUploaders = []
-		if self.WordPressURI is not None:
-			self.blogUploaders.append( WordPressUploader( self.WordPressURI, self.loginName, self.loginPassword ) )
+		self.blogUploaders = [] #Filled in by parseOptions(), since the blogs are given on the command line
+		self.uploadExecutors = None #One single-thread executor per uploader while generateComics() is uploading in the background, else None
+		self.uploads = [] #The futures of background uploads which haven't been checked yet
 		
 		self.generators = dict() #A dictionary of Markov chain generators, one per character. Moved this line out of the for loop so we don't have to waste time regenerating Markov graphs when two or more comics have the same characters in them. Search for "for speaker in speakers:\nif speaker not in generators:" - this was originally just above that.
+		self.textWidths = dict() #Maps each font to a dictionary mapping text to its width in pixels. Measuring text is slow (FreeType has to lay out the whole string every time), and the same words and spaces get measured over and over while searching for a font size. Grouping the widths by font lets getFont() forget a font's widths along with the font.
+		self.textWidthCount = 0 #How many widths textWidths holds in total
+		self.maxTextWidths = 100000
+		self.fonts = OrderedDict() #Maps ( font file, size ) to a loaded font, least recently used first. Loading a font means parsing the whole file, and the same few sizes get used over and over.
+		self.maxBalancedWords = 200 #Text with more words than this gets wrapped greedily. breakLines() looks at every possible line for every word, which gets slow for long text, and long text in a small bubble gets tiny anyway.
+		self.maxFonts = 256 #Each loaded font holds its own FreeType face, so don't keep every size ever tried
+		self.fontData = dict() #Maps font file names to the files' contents, so that loading a font at a new size doesn't mean reading the file from disk again.
 		
 
 	def stringFromNodes( self, nodeList, useFormatting = True ):
 		'''Given a list of nodes, put them all into a string.
 		'''
-		result = ""
+		words = []
 		for node in nodeList:
 			prefix = ""
 			postfix = ""
@@ -112,9 +230,70 @@ class MarkovApp( App ):
 					prefix = "_" + prefix
 					postfix = postfix + "_"
 			
-			result += prefix + node.word + postfix + " "
-		result.rstrip()
-		return result
+			words.append( prefix + node.word + postfix )
+		return " ".join( words )
+
+	def textWidth( self, font, text ):
+		'''Find the width of a string of text, measuring it only if it hasn't been measured in this font before.
+			Args:
+				font: The font used to measure the text.
+				text: The string to measure.
+			Returns:
+				The width in pixels.
+		'''
+		widths = self.textWidths.get( font )
+		if widths is None or text not in widths:
+			if self.textWidthCount >= self.maxTextWidths: #Don't let a long run of comics fill up memory with the widths of words we'll never see again
+				self.textWidths.clear()
+				self.textWidthCount = 0
+				widths = None
+			if widths is None:
+				widths = self.textWidths[ font ] = dict()
+			try:
+				widths[ text ] = font.getlength( text )
+			except AttributeError: #getlength() was added in Pillow 8.0. It's faster than getsize() because it doesn't calculate a bounding box.
+				widths[ text ] = font.getsize( text )[ 0 ]
+			self.textWidthCount += 1
+		return widths[ text ]
+
+	def lineHeight( self, font ):
+		'''Find the height of one line of text. Every line gets the same height, so this doesn't depend on what the text is.
+			Args:
+				font: The font the text is written in.
+			Returns:
+				The height in pixels.
+		'''
+		try:
+			ascent, descent = font.getmetrics()
+			return ascent + descent
+		except AttributeError: #Bitmap fonts, such as the one from ImageFont.load_default() without FreeType, don't have getmetrics()
+			pass
+		try:
+			return font.getbbox( "Ag" )[ 3 ]
+		except AttributeError: #getbbox() was added in Pillow 8.0; getsize() was removed in 10.0
+			return font.getsize( "Ag" )[ 1 ]
+
+	def getFont( self, fontFile, size ):
+		'''Load a font, or reuse it if it has already been loaded at this size.
+			Args:
+				fontFile: The path to the font file.
+				size: The font size.
+			Returns:
+				A PIL ImageFont.
+		'''
+		key = ( fontFile, size )
+		if key in self.fonts:
+			font = self.fonts.pop( key ) #Re-inserted below, moving it to the end: the most recently used
+		else:
+			if fontFile not in self.fontData:
+				with open( fontFile, "rb" ) as f:
+					self.fontData[ fontFile ] = f.read()
+			font = ImageFont.truetype( io.BytesIO( self.fontData[ fontFile ] ), size = size )
+			if len( self.fonts ) >= self.maxFonts:
+				oldKey, oldFont = self.fonts.popitem( last = False ) #Forget the least recently used
+				self.textWidthCount -= len( self.textWidths.pop( oldFont, () ) ) #Its widths would otherwise keep it alive
+		self.fonts[ key ] = font
+		return font
 
 	def findCharsPerLine( self, text, normalFont, maxWidth ):
 		'''Find how many characters will fit within the specified width.
@@ -126,21 +305,75 @@ class MarkovApp( App ):
 				An integer indicating how many characters fit within maxWidth.
 		'''
 		
-		if maxWidth < 1:
-			maxWidth = 1
-		
-		charsPerLine = maxWidth // normalFont.getsize( "L" )[ 0 ] #Capital L is generaly a pretty wide character
-		
-		if charsPerLine < 1:
-			charsPerLine = 1
+		#Find the longest prefix of text that fits. Prefix widths only grow as characters are added, so a binary search works, and measuring whole prefixes accounts for kerning between characters.
+		fewest = 1 #Even if nothing fits we have to put something on the line
+		most = max( len( text ), 1 )
+		while fewest < most:
+			charsPerLine = ( fewest + most + 1 ) // 2
+			if self.textWidth( normalFont, text[ :charsPerLine ] ) <= maxWidth:
+				fewest = charsPerLine
+			else:
+				most = charsPerLine - 1
 		
-		while normalFont.getsize( text[ :charsPerLine ] )[ 0 ] > maxWidth:
-			charsPerLine -= 1
+		return fewest
+
+	def countGreedyLines( self, wordWidths, spaceWidth, maxWidth ):
+		'''Count the lines a simple word wrap, filling each line as full as it will go, would break text into. That's as few lines as breakLines() finds, without looking at every possible line for every word.
+			Args:
+				wordWidths: A list of the widths of the words in pixels. Words wider than maxWidth each get a line to themselves.
+				spaceWidth: The width of the space between words.
+				maxWidth: The maximum width in pixels.
+			Returns:
+				The number of lines.
+		'''
+		lines = 0
+		lineWidth = None #None until the current line has a word on it
+		for wordWidth in wordWidths:
+			if lineWidth is not None and lineWidth + spaceWidth + wordWidth <= maxWidth:
+				lineWidth += spaceWidth + wordWidth
+			else:
+				lines += 1
+				lineWidth = wordWidth
+		return lines
+
+	def breakLines( self, wordWidths, spaceWidth, maxWidth ):
+		'''Decide where to break text into lines. Uses as few lines as possible, and of the ways to do that, picks the one whose lines are most even in width (Knuth and Plass's minimum raggedness). Filling each line as full as it will go, as a simple word wrap does, tends to leave one or two short lines at the end.
+			Args:
+				wordWidths: A list of the widths of the words in pixels. Words wider than maxWidth each get a line to themselves.
+				spaceWidth: The width of the space between words.
+				maxWidth: The maximum width in pixels.
+			Returns:
+				A list of the index of the first word on each line.
+		'''
+		count = len( wordWidths )
 		
-		if charsPerLine < 1:
-			charsPerLine = 1
+		#Work backwards from the end. best[ start ] is the ( number of lines, raggedness ) of the best way to lay out the words from start onward, and lineEnd[ start ] is where that layout's first line ends. Tuples compare element by element, so fewer lines always wins and raggedness only breaks ties.
+		best = [ None ] * count + [ ( 0, 0 ) ]
+		lineEnd = [ count ] * ( count + 1 )
+		for start in range( count - 1, -1, -1 ):
+			lineWidth = -spaceWidth
+			for end in range( start + 1, count + 1 ):
+				lineWidth += spaceWidth + wordWidths[ end - 1 ]
+				if lineWidth > maxWidth and end > start + 1:
+					break
+				
+				if end == count:
+					badness = 0 #The last line is allowed to be short
+				else:
+					badness = ( maxWidth - lineWidth ) ** 2
+				
+				lines, raggedness = best[ end ]
+				candidate = ( lines + 1, raggedness + badness )
+				if best[ start ] is None or candidate < best[ start ]:
+					best[ start ] = candidate
+					lineEnd[ start ] = end
 		
-		return charsPerLine
+		breaks = []
+		start = 0
+		while start < count:
+			breaks.append( start )
+			start = lineEnd[ start ]
+		return breaks
 
 	def rewrap_nodelistlist( self, nodeList, normalFont, boldFont, maxWidth, fontSize = 10, center=True ):
 		'''Rewrap and center text.
@@ -167,65 +400,93 @@ class MarkovApp( App ):
 			else:
 				node.font = normalFont
 		
-		lineList = []
-		temp = []
-		for node in nodeList:
-			lineWidth = normalFont.getsize( self.stringFromNodes( lineList ) )[ 0 ]
-			wordWidth = node.font.getsize( node.word )[ 0 ]
-			if lineWidth + wordWidth <= maxWidth:
-				lineList.append( node )
-			elif wordWidth <= maxWidth:
-				temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
-				lineList = [ node ]
-			else:
-				#temp.append( stringFromNodes( lineList, useFormatting = False ) )#.rstrip() )
-				#line = node.word + " "
-				if "\N{SOFT HYPHEN}" in node.word:
-					#Split on hyphens if there are any...
-					splitted = node.word.split( "\N{SOFT HYPHEN}", 1 )
-					firstSection = splitted[ 0 ] + "-"
-					secondSection = splitted[ 1 ]
-				elif "-" in node.word:
-					splitted = node.word.split( "-", 1 )
-					firstSection = splitted[ 0 ] + "-"
-					secondSection = splitted[ 1 ]
+		spaceWidth = self.textWidth( normalFont, " " )
+		
+		wordWidths = [ self.textWidth( node.font, node.word ) for node in nodeList ]
+		
+		if max( wordWidths + [ 0 ] ) <= maxWidth and len( nodeList ) <= self.maxBalancedWords:
+			#No words need splitting, so we can afford to choose the breaks carefully.
+			breaks = self.breakLines( wordWidths, spaceWidth, maxWidth ) + [ len( nodeList ) ]
+			temp = [ nodeList[ breaks[ i ]:breaks[ i + 1 ] ] for i in range( len( breaks ) - 1 ) ] or [ [] ]
+		else:
+			lineList = []
+			lineWidth = 0 #The width of the words in lineList and the spaces between them. This is a running total so that we don't have to re-measure the whole line every time a word is added.
+			temp = []
+			pending = list( zip( nodeList, wordWidths ) )
+			pending.reverse() #Words are taken from the end. When a word gets split, whatever doesn't fit goes back on the end to be placed (and split again if need be) like any other word.
+			while len( pending ) > 0:
+				node, wordWidth = pending.pop()
+				if len( lineList ) > 0:
+					room = maxWidth - lineWidth - spaceWidth
 				else:
-					middle = len( node.word ) // 2
-					firstSection = node.word[ :middle ] + "-"
-					secondSection = node.word[ middle: ]
+					room = maxWidth
 				
-				firstSectionNode = MarkovNode( firstSection, node.isEnd, isBold = boldNodes[ node ], isItalic = italicNodes[ node ], isUnderlined = underlinedNodes[ node ], font = node.font )
-				secondSectionNode = MarkovNode( secondSection, node.isEnd, isBold = boldNodes[ node ], isItalic = italicNodes[ node ], isUnderlined = underlinedNodes[ node ], font = node.font )
-				lineList.append( firstSectionNode )
-				temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
-				lineList = [ secondSectionNode ]
-		#line = line.rstrip()
-		temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
+				if wordWidth <= room:
+					if len( lineList ) > 0:
+						lineWidth += spaceWidth
+					lineList.append( node )
+					lineWidth += wordWidth
+				elif wordWidth <= maxWidth or len( node.word ) < 2: #A single character too wide for any line can't be split, so it gets a line to itself
+					if len( lineList ) > 0:
+						temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
+					lineList = [ node ]
+					lineWidth = wordWidth
+				else:
+					#Split on hyphens if there are any and the first part fits...
+					firstSection = None
+					for hyphen in [ "\N{SOFT HYPHEN}", "-" ]:
+						if hyphen in node.word:
+							splitted = node.word.split( hyphen, 1 )
+							if self.textWidth( node.font, splitted[ 0 ] + "-" ) <= room:
+								firstSection = splitted[ 0 ] + "-"
+								secondSection = splitted[ 1 ]
+							break
+					
+					if firstSection is None:
+						#...otherwise split the word wherever the current line runs out of room
+						middle = self.findCharsPerLine( node.word, node.font, room - self.textWidth( node.font, "-" ) )
+						middle = min( middle, len( node.word ) - 1 )
+						firstSection = node.word[ :middle ] + "-"
+						secondSection = node.word[ middle: ]
+						if len( lineList ) > 0 and self.textWidth( node.font, firstSection ) > room:
+							#Not even one letter fits on the end of this line, so start the word on the next one
+							temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
+							lineList = []
+							lineWidth = 0
+							pending.append( ( node, wordWidth ) )
+							continue
+					
+					firstSectionNode = MarkovNode( firstSection, node.isEnd, isBold = boldNodes[ node ], isItalic = italicNodes[ node ], isUnderlined = underlinedNodes[ node ], font = node.font )
+					lineList.append( firstSectionNode )
+					temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
+					lineList = []
+					lineWidth = 0
+					
+					if len( secondSection ) > 0:
+						secondSectionNode = MarkovNode( secondSection, node.isEnd, isBold = boldNodes[ node ], isItalic = italicNodes[ node ], isUnderlined = underlinedNodes[ node ], font = node.font )
+						boldNodes[ secondSectionNode ] = boldNodes[ node ]
+						italicNodes[ secondSectionNode ] = italicNodes[ node ]
+						underlinedNodes[ secondSectionNode ] = underlinedNodes[ node ]
+						pending.append( ( secondSectionNode, self.textWidth( node.font, secondSection ) ) )
+			temp.append( lineList )#stringFromNodes( lineList, useFormatting = False ) )
 		
 		temp2 = []
 		for nodeList in temp:
 			line = []
 			for node in nodeList:
-				try:
-					node.word = "".join( [ ch for ch in node.word if ch.isprintable() ] )
-				except AttributeError:
-					node.word = "".join( [ ch for ch in node.word if ch in string.printable ] )
+				node.word = removeUnprintable( node.word )
 				
 				line.append( node )
 			temp2.append( line )
 		
 		result = []
 		for line in temp2:
-			lineWidth = 0 #normalFont.getsize( line )[ 0 ]
-			
+			lineWidth = -spaceWidth #There's one fewer space than there are words
 			for node in line:
-				lineWidth += normalFont.getsize( " " )[ 0 ] + node.font.getsize( node.word )[ 0 ]
-			
-			lineWidth -= normalFont.getsize( " " )[ 0 ]
+				lineWidth += spaceWidth + self.textWidth( node.font, node.word )
 			
 			if center and lineWidth < maxWidth:
 				difference = maxWidth - lineWidth
-				spaceWidth = normalFont.getsize( " " )[ 0 ]
 				if spaceWidth > 0 and spaceWidth < difference:
 					difference = difference - spaceWidth
 					numberOfSpaces = int( ( difference / spaceWidth ) // 2 )
@@ -238,6 +499,111 @@ class MarkovApp( App ):
 
 
 
+	def wrapAtSize( self, nodeList, size, maxWidth ):
+		'''Load fonts of the given size and wrap text with them.
+			Args:
+				nodeList: A list of nodes containing the text to be wrapped.
+				size: The font size.
+				maxWidth: The maximum width in pixels.
+			Returns:
+				A tuple of the normal font, the bold font, and the list of lists of nodes returned by rewrap_nodelistlist().
+		'''
+		normalFont, boldFont = self.loadFonts( size )
+		return normalFont, boldFont, self.rewrap_nodelistlist( nodeList, normalFont, boldFont, maxWidth, fontSize = size )
+
+	def loadFonts( self, size ):
+		'''Load the normal and bold fonts at the given size.
+			Args:
+				size: The font size.
+			Returns:
+				A tuple of the normal font and the bold font.
+		'''
+		if self.normalFontFile is not None and self.boldFontFile is not None: #None if no font could be found, or once loading one has failed
+			try:
+				return self.getFont( self.normalFontFile, size ), self.getFont( self.boldFontFile, size )
+			except IOError as error: #e.g. a font given with -f which doesn't exist or isn't a font
+				six.print_( error, "\nUsing default font instead.", file=sys.stderr )
+				self.normalFontFile = self.boldFontFile = None #Don't keep trying (and complaining) at every size
+		defaultFont = ImageFont.load_default()
+		return defaultFont, defaultFont
+
+	def estimateLargestSize( self, nodeList, maxSize, maxWidth, maxHeight ):
+		'''Estimate the largest font size at which text fits within a word bubble. The text is measured once, at maxSize, and every smaller size is tried by scaling those measurements, which is far quicker than measuring the text again at each size. Glyph widths don't scale exactly (hinting and rounding see to that), so the result should be checked with textFits().
+			Args:
+				nodeList: A list of nodes containing the text.
+				maxSize: The largest font size to consider.
+				maxWidth: The width of the word bubble in pixels.
+				maxHeight: The height of the word bubble in pixels.
+			Returns:
+				A font size between 1 and maxSize.
+		'''
+		normalFont, boldFont = self.loadFonts( maxSize )
+		wordWidths = []
+		for node in nodeList:
+			if node.isBold():
+				wordWidths.append( self.textWidth( boldFont, node.word ) )
+			else:
+				wordWidths.append( self.textWidth( normalFont, node.word ) )
+		spaceWidth = self.textWidth( normalFont, " " )
+		lineHeight = self.lineHeight( normalFont )
+		
+		smallestSize = 1
+		largestSize = maxSize
+		
+		#However the text gets wrapped, the words can't take up more room than the bubble has: total word width times line height must be at most maxWidth times maxHeight. Both grow in proportion to the font size, so that gives a ceiling on the size without trying any.
+		textArea = sum( wordWidths ) * lineHeight
+		if textArea > 0:
+			largestSize = max( 1, min( maxSize, int( maxSize * math.sqrt( maxWidth * maxHeight / float( textArea ) ) ) ) )
+		
+		while smallestSize < largestSize:
+			size = ( smallestSize + largestSize + 1 ) // 2
+			scale = size / float( maxSize )
+			scaledWidths = [ wordWidth * scale for wordWidth in wordWidths ]
+			if len( scaledWidths ) > self.maxBalancedWords: #rewrap_nodelistlist() wraps these greedily too
+				lines = self.countGreedyLines( scaledWidths, spaceWidth * scale, maxWidth )
+			else:
+				lines = len( self.breakLines( scaledWidths, spaceWidth * scale, maxWidth ) )
+			for wordWidth in scaledWidths:
+				lines += int( wordWidth // maxWidth ) #Words too wide for a line get split across several
+			if lines * lineHeight * scale <= maxHeight:
+				smallestSize = size
+			else:
+				largestSize = size - 1
+		return smallestSize
+
+	def fitsAtSize( self, nodeList, size, maxWidth, maxHeight ):
+		'''Check whether text fits within a word bubble at a given font size.
+			Args:
+				nodeList: A list of nodes containing the text.
+				size: The font size.
+				maxWidth: The width of the word bubble in pixels.
+				maxHeight: The height of the word bubble in pixels.
+			Returns:
+				A Boolean indicating whether the text fits.
+		'''
+		normalFont, boldFont, listoflists = self.wrapAtSize( nodeList, size, maxWidth )
+		return self.textFits( listoflists, normalFont, maxWidth, maxHeight )
+
+	def textFits( self, listoflists, normalFont, maxWidth, maxHeight ):
+		'''Check whether wrapped text fits within a word bubble.
+			Args:
+				listoflists: A list of lists of nodes, as returned by rewrap_nodelistlist().
+				normalFont: The non-bold font the text was wrapped with.
+				maxWidth: The width of the word bubble in pixels.
+				maxHeight: The height of the word bubble in pixels.
+			Returns:
+				A Boolean indicating whether the text fits.
+		'''
+		if len( listoflists ) * self.lineHeight( normalFont ) > maxHeight:
+			return False
+		
+		for line in listoflists:
+			#Measure each line in one go rather than word by word; FreeType does the adding up for us.
+			if self.textWidth( normalFont, " ".join( [ node.word for node in line ] ) ) > maxWidth:
+				return False
+		
+		return True
+
 	def findSuitableFont( self, charToCheck = None, preferBold = False, preferNormal = True ):
 		'''Find a font that fits the given requirements.
 			Args:
@@ -247,6 +613,27 @@ class MarkovApp( App ):
 				A string representing a path to a suitable font file, or None if none could be found.
 			'''
 		
+		key = ( preferBold, preferNormal )
+		if key not in self.suitableFonts:
+			self.suitableFonts[ key ] = self.searchForSuitableFont( preferBold, preferNormal )
+		return self.suitableFonts[ key ]
+
+	def searchForSuitableFont( self, preferBold, preferNormal ):
+		'''Does the work for findSuitableFont(), which remembers the results.
+			Args:
+				preferBold: A Boolean indicating whether bold fonts will be preferred over non-bold.
+				preferNormal: A Boolean indicating whether fonts of the style "medium", "regular", or "normal" will be preferred.
+			Returns:
+				A string representing a path to a suitable font file, or None if none could be found.
+		'''
+		#Fonts in the fonts directory come first. Among them, prefer ones of the requested style.
+		localFonts = self.scanFontsDir()
+		for style, fontFile in localFonts.items():
+			if ( preferBold and "bold" in style ) or ( preferNormal and style in NORMAL_FONT_STYLES ):
+				return fontFile
+		for fontFile in localFonts.values():
+			return fontFile
+		
 		#There's no standard "comic" font style, so instead we use a list of known comic-ish font families. Feel free to add to the list or to reorder it however you want. Ubuntu Titling isn't very comic-ish; I just wanted something that doesn't resemble Arial or Times to come after Comic Sans.
 		#families = [ "Nina Improved", "Nina", "Humor Sans", "Tomson Talks", "Nibby", "Vipond Comic LC", "Vipond Comic UC", "Comic Neue", "Comic Neue Angular", "Comic Relief", "Dekko", "Ruji's Handwriting Font", "Open Comic Font", "Comic Sans MS", "Ubuntu Titling" ]
 		families = [ "ninaimproved", "nina", "humorsans", "tomsontalks", "nibby", "vipondcomiclc", "vipondcomicuc", "comicneue", "comicneueangular", "comicrelief", "dekko", "ruji'shandwritingfont", "opencomicfont", "comicsansms", "ubuntutitling" ]
@@ -256,6 +643,32 @@ class MarkovApp( App ):
 				break
 		return fontFile
 
+	def scanFontsDir( self ):
+		'''Find all the usable fonts in the fonts directory, indexed by style. The directory only gets read (and each font only gets loaded) the first time this is called.
+			Returns:
+				An OrderedDict mapping each lower-case style name to the path of the first font file (in alphabetical order) having that style. Styles are in the order of those files.
+		'''
+		if self.localFonts is None:
+			self.localFonts = OrderedDict()
+			try:
+				if scandir is not None: #scandir() knows whether each entry is a file without needing a separate stat() call
+					fontFiles = [ entry.path for entry in scandir( self.fontsDir ) if entry.is_file() ]
+				else:
+					fontFiles = [ os.path.join( self.fontsDir, fileName ) for fileName in os.listdir( self.fontsDir ) ]
+					fontFiles = [ fontFile for fontFile in fontFiles if os.path.isfile( fontFile ) ]
+			except OSError: #The fonts directory is optional
+				fontFiles = []
+			
+			for fontFile in sorted( fontFiles ):
+				if fontFile.lower().endswith( ( ".ttf", ".otf", ".ttc" ) ):
+					try:
+						family, style = ImageFont.truetype( fontFile ).getname()
+					except IOError:
+						continue
+					self.localFonts.setdefault( style.lower(), fontFile )
+		
+		return self.localFonts
+
 	def usage( self ):
 		'''Print command line usage info.
 		'''
@@ -279,8 +692,24 @@ class MarkovApp( App ):
 		six.print_( "🞍 -t or --top: The path to an image which will be appended at the top of each comic. Should be the same width as the comic images. Good for names or logos." )
 		six.print_( "🞍 -u or --WordPress-uri: The URI of a WordPress blog's xmlrpc.php file. Specify this if you want the comic automatically uploaded as a blog post. Will probably require that --login-name and --login-password be specified too (this is up to WordPress, not us). Defaults to", self.WordPressURIDefault )
 		six.print_( "🞍 -w or --saveforweb: If specified, saves the images using settings which result in a smaller file size, possibly at the expense of image quality." )
+		six.print_( "🞍 -z or --optimize-png: If specified, spends extra time compressing images saved with --saveforweb. If oxipng is installed, it does the compressing; otherwise Pillow does. Defaults to", self.optimizePNGDefault )
 
 
+	def numberedFileName( self, fileName, generatedComicNumber ):
+		'''Work out the name of an output file for one of several comics.
+			Args:
+				fileName: The output file name given on the command line.
+				generatedComicNumber: Which comic this is.
+			Returns:
+				The file name with the comic's number inserted before the extension, or the file name unchanged if only one comic is being generated.
+		'''
+		if self.numberOfComics == 1:
+			return fileName
+		if fileName not in self.splitFileNames:
+			self.splitFileNames[ fileName ] = os.path.splitext( fileName )
+		name, extension = self.splitFileNames[ fileName ]
+		return name + str( generatedComicNumber ) + extension
+
 	def isWritable( self, fileName ):
 		'''Tests whether a given file can be opened for writing.
 			Args:
@@ -290,449 +719,687 @@ class MarkovApp( App ):
 		'''
 		if os.access( fileName, os.F_OK ): #file exists
 			return os.access( fileName, os.W_OK )
-		else: #file doesn't exist
-			try:
-				open( fileName, "w" )
-			except OSError:
-				return False
-			else:
-				os.remove( fileName )
-				return True
+		else: #file doesn't exist, so it's up to whether we can create files in its directory
+			return os.access( os.path.dirname( fileName ) or os.curdir, os.W_OK | os.X_OK )
 
 
 
 	def parseOptions( self ):
 		try:
-			options, argsLeft = getopt.getopt( sys.argv[ 1: ], "swhni:o:p:g:f:t:ru:l:a:c:b:d:", [ "silent", "saveforweb", "help", "no-gui", "indir=", "outtextfile=", "outimagefile=", "generate=", "font=", "top=", "randomize-capitals", "WordPress-uri=", "login-name=", "login-password=", "comic-id=", "long-name=", "short-name=" ] )
+			options, argsLeft = getopt.getopt( sys.argv[ 1: ], "swzhni:o:p:g:f:t:ru:l:a:c:b:d:", [ "silent", "saveforweb", "optimize-png", "help", "no-gui", "indir=", "outtextfile=", "outimagefile=", "generate=", "font=", "top=", "randomize-capitals", "WordPress-uri=", "login-name=", "login-password=", "comic-id=", "long-name=", "short-name=" ] )
 		except getopt.GetoptError as error:
 			six.print_( error )
 			self.usage()
 			sys.exit( EX_USAGE );
 
-		for option in options:
-			if option[ 0 ] == "-s" or option[ 0 ] == "--silent":
-				self.silence = True
-			elif option[ 0 ] == "-i" or option[ 0 ] == "--indir":
-				self.inDir = option[ 1 ]
-			elif option[ 0 ] == "-o" or option[ 0 ] == "--outtextfile":
-				self.outTextFileName = option[ 1 ]
-			elif option[ 0 ] == "-p" or option[ 0 ] == "--outimagefile":
-				self.outImageFileName = option[ 1 ]
-			elif option[ 0 ] == "-n" or option[ 0 ] == "--number":
-				self.numberOfComics = int( option[ 1 ] )
-			elif option[ 0 ] == "-w" or option[ 0 ] == "--saveforweb":
-				self.saveForWeb = True
-			elif option[ 0 ] == "-h" or option[ 0 ] == "--help":
+		#Maps each option to the attribute it sets and a function turning the option's argument (empty for options that don't take one) into the attribute's value.
+		flag = lambda argument: True
+		keep = lambda argument: argument
+		optionAttributes = dict()
+		for shortOption, longOption, attribute, convert in [
+			( "-s", "--silent", "silence", flag ),
+			( "-i", "--indir", "inDir", keep ),
+			( "-o", "--outtextfile", "outTextFileName", keep ),
+			( "-p", "--outimagefile", "outImageFileName", keep ),
+			( "-g", "--generate", "numberOfComics", int ),
+			( "-n", "--no-gui", "noGUI", flag ),
+			( "-w", "--saveforweb", "saveForWeb", flag ),
+			( "-z", "--optimize-png", "optimizePNG", flag ),
+			( "-f", "--font", "commandLineFont", keep ),
+			( "-t", "--top", "topImageFileName", keep ),
+			( "-r", "--randomize-capitals", "randomizeCapitals", flag ),
+			( "-u", "--WordPress-uri", "WordPressURI", keep ),
+			( "-l", "--login-name", "loginName", keep ),
+			( "-a", "--login-password", "loginPassword", keep ),
+			( "-d", "--short-name", "shortName", keep ),
+			( "-b", "--long-name", "longName", keep ),
+			( "-c", "--comic-id", "commandLineComicID", keep ) ]:
+			optionAttributes[ shortOption ] = optionAttributes[ longOption ] = ( attribute, convert )
+		
+		for option, argument in options:
+			if option == "-h" or option == "--help":
 				self.usage()
 				sys.exit( EX_OK )
-			elif option[ 0 ] == "-f" or option[ 0 ] == "--font":
-				self.commandLineFont = option[ 1 ]
-			elif option[ 0 ] == "-t" or option[ 0 ] == "--top":
-				self.topImageFileName = option[ 1 ]
-			elif option[ 0 ] == "-r" or option[ 0 ] == "--randomize-capitals":
-				self.randomizeCapitals = True
-			elif option[ 0 ] == "-u" or option[ 0 ] == "--WordPress-uri":
-				self.WordPressURI = option[ 1 ]
-			elif option[ 0 ] == "-l" or option[ 0 ] == "--login-name":
-				self.loginName = option[ 1 ]
-			elif option[ 0 ] == "-a" or option[ 0 ] == "--login-password":
-				self.loginPassword = option[ 1 ]
-			elif option[ 0 ] == "-d" or option[ 0 ] == "--short-name":
-				self.shortName = option[ 1 ]
-			elif option[ 0 ] == "-b" or option[ 0 ] == "--long-name":
-				self.longName = option[ 1 ]
-			elif option[ 0 ] == "-c" or option[ 0 ] == "--comic-id":
-				self.commandLineComicID = option[ 1 ]
+			
+			attribute, convert = optionAttributes[ option ]
+			try:
+				setattr( self, attribute, convert( argument ) )
+			except ValueError:
+				six.print_( "Error:", argument, "is not a valid argument for", option, file=sys.stderr )
+				self.usage()
+				sys.exit( EX_USAGE )
 
 		if self.longName is None:
 			self.longName = self.shortName
 
 
+		if self.commandLineFont is not None:
+			self.normalFontFile = self.boldFontFile = self.commandLineFont #The one font gets used for bold words too
+		
 		#Verify user input
 		#commandLineFont is not verified here; it will be verified when loading the font.
 		if not os.path.isdir( self.inDir ):
 			six.print_( "Error:", self.inDir, "is not a directory.", file=sys.stderr )
-			exit( EX_NOINPUT )
+			sys.exit( EX_NOINPUT )
 		elif os.path.exists( self.outTextFileName ) and not os.path.isfile(self. outTextFileName ):
 			six.print_( "Error:", self.outTextFileName, "is not a file.", file=sys.stderr )
-			exit( EX_CANTCREAT )
+			sys.exit( EX_CANTCREAT )
 		elif not self.isWritable( self.outTextFileName ):
 			six.print_( "Error:", self.outTextFileName, "is not writable.", file=sys.stderr )
-			exit( EX_CANTCREAT )
+			sys.exit( EX_CANTCREAT )
 		elif os.path.exists( self.outImageFileName ) and not os.path.isfile( self.outImageFileName ):
 			six.print_( "Error:",self. outImageFileName, "is not a file.", file=sys.stderr )
-			exit( EX_CANTCREAT )
+			sys.exit( EX_CANTCREAT )
 		elif not self.isWritable( self.outImageFileName ):
 			six.print_( "Error:", self.outImageFileName, "is not writable.", file = sys.stderr )
-			exit( EX_CANTCREAT )
+			sys.exit( EX_CANTCREAT )
 		elif self.numberOfComics < 1:
 			six.print_( "Error: Number of comics (", self.numberOfComics, ") is less than 1.", file=sys.stderr )
-			exit( EX_USAGE )
+			sys.exit( EX_USAGE )
 		elif self.topImageFileName != None:
 			if not os.path.exists( self.topImageFileName ):
 				six.print_( "Error:", self.topImageFileName, "does not exist.", file=sys.stderr )
-				exit( EX_NOINPUT )
+				sys.exit( EX_NOINPUT )
 			elif not os.path.isfile( self.topImageFileName ):
 				six.print_( "Error:", self.topImageFileName, "is not a file.", file=sys.stderr )
-				exit( EX_NOINPUT )
+				sys.exit( EX_NOINPUT )
 			elif not os.access( self.topImageFileName, os.R_OK ):
 				six.print_( "Error:", self.topImageFileName, "is not readable (permission error - did you mess up a chmod?)", file = sys.stderr )
-				exit( EX_NOPERM )
+				sys.exit( EX_NOPERM )
 		elif self.loginName is not None and len( self.loginName ) < 1:
 			six.print_( "Error: loginName has length zero." )
-			exit( EX_USAGE )
+			sys.exit( EX_USAGE )
 		elif self.loginPassword is not None and len( self.loginPassword ) < 1:
 			six.print_( "Error: loginPassword has length zero." )
-			exit( EX_USAGE )
+			sys.exit( EX_USAGE )
 		elif ( self.commandLineComicID is not None ) and not idChecker.checkString( self.commandLineComicID ):
 			six.print_( "Error:", self.commandLineComicID, "is not a valid comic ID" )
-			exit( EX_USAGE )
+			sys.exit( EX_USAGE )
+		
+		if self.WordPressURI is not None:
+			self.blogUploaders.append( WordPressUploader( self.WordPressURI, self.loginName, self.loginPassword ) )
 
 
 	
-	def generateComics( self, instance ):
-		image = Image.new( mode="1", size=(0, 0) )
-		for self.generatedComicNumber in range( self.numberOfComics ):
-			try:
-				if self.commandLineComicID is None:
-					wordBubbleFileName = random.choice( os.listdir( self.wordBubblesDir ) )
-				else:
-					wordBubbleFileName = os.path.join( self.wordBubblesDir, self.commandLineComicID + ".tsv" )
-			except IndexError as error:
-				six.print_( error, file=sys.stderr )
-				exit( EX_NOINPUT )
+	def getOriginalURL( self, comicID ):
+		'''Find where a comic was originally published. When generating more than one comic, sources.tsv only gets read the first time this is called.
+			Args:
+				comicID: The comic's ID, as a string.
+			Returns:
+				A URL as a string, or None if sources.tsv doesn't list the comic.
+		'''
+		if self.originalURLs is None and self.numberOfComics == 1:
+			return self.findOriginalURL( comicID ) #Only one URL is needed, so rather than parsing every line, search the file for the one line we want
+		
+		if self.originalURLs is None:
+			self.loadOriginalURLs()
+		return self.originalURLs.get( comicID )
+
+	def readSources( self ):
+		'''Read the whole of sources.tsv.
+			Returns:
+				The file's contents as a native string, so that the URLs can be added to transcripts of the same type (on Python 2, both are UTF-8 byte strings).
+		'''
+		with io.open( os.path.join( self.inDir, "sources.tsv" ), "rt", encoding="utf-8", buffering=1 << 16 ) as URLFile: #The file gets read straight through, so read it in big chunks
+			contents = URLFile.read()
+		if six.PY2:
+			contents = contents.encode( "utf-8" )
+		return contents
+
+	def parseSourcesLine( self, line ):
+		'''Split a line of sources.tsv into a comic ID and a URL.
+			Args:
+				line: The line, as a string.
+			Returns:
+				A tuple of the comic ID and the URL, or None if the line doesn't list a URL (e.g. it's blank or all comment).
+		'''
+		commentStart = line.find( self.commentMark ) #Unlike partition(), find() doesn't build a tuple for every line, and most lines have no comment
+		if commentStart >= 0:
+			line = line[ :commentStart ]
+		line = line.strip()
+		
+		if len( line ) > 0:
+			line = line.split( "\t", 2 ) #Any columns after the URL are ignored
+			if len( line ) > 1:
+				return line[ 0 ], line[ 1 ]
+		return None
+
+	def loadOriginalURLs( self ):
+		'''Read sources.tsv into originalURLs, a dictionary mapping comic IDs to the URLs where they were originally published.
+		'''
+		self.originalURLs = dict()
+		try:
+			for line in self.readSources().split( "\n" ):
+				listing = self.parseSourcesLine( line )
+				if listing is not None:
+					self.originalURLs.setdefault( listing[ 0 ], listing[ 1 ] ) #If a comic is listed twice, the first listing wins
+		except IOError as error: #The comics can be made without their URLs
+			six.print_( error, file=sys.stderr )
+
+	def findOriginalURL( self, comicID ):
+		'''Find where a comic was originally published without parsing all of sources.tsv. Gives the same answer as loadOriginalURLs() would: any line listing the comic has to contain its ID, so only the lines where the ID turns up get parsed, in order, and the first which lists it wins.
+			Args:
+				comicID: The comic's ID, as a string.
+			Returns:
+				A URL as a string, or None if sources.tsv doesn't list the comic.
+		'''
+		try:
+			contents = self.readSources()
+		except IOError as error: #The comics can be made without their URLs
+			six.print_( error, file=sys.stderr )
+			return None
+		
+		found = contents.find( comicID )
+		while found >= 0:
+			lineStart = contents.rfind( "\n", 0, found ) + 1
+			lineEnd = contents.find( "\n", found )
+			if lineEnd < 0:
+				lineEnd = len( contents )
+			
+			listing = self.parseSourcesLine( contents[ lineStart:lineEnd ] )
+			if listing is not None and listing[ 0 ] == comicID:
+				return listing[ 1 ]
+			found = contents.find( comicID, lineEnd + 1 ) #The ID turned up in a comment, a URL, or a longer ID
+		return None
+
+	def getTopImage( self, mode ):
+		'''Get the image which goes at the top of each comic. It only gets read from disk once, and only gets converted once for each mode it's needed in.
+			Args:
+				mode: The mode the image should be in.
+			Returns:
+				A PIL image.
+		'''
+		if mode not in self.topImages:
+			if self.topImage is None:
+				try:
+					self.topImage = Image.open( self.topImageFileName )
+					self.topImage.load()
+				except IOError as error:
+					six.print_( error, file=sys.stderr )
+					sys.exit( EX_NOINPUT )
+			self.topImages[ mode ] = self.topImage.convert( mode=mode )
+		return self.topImages[ mode ]
+
+	def getGenerator( self, speaker ):
+		'''Get the Markov chain generator for a character, building its graph the first time the character is needed. The graphs don't change between comics, so each one only gets built once per run.
+			Args:
+				speaker: The character's name, in upper case.
+			Returns:
+				A Generator.
+		'''
+		if speaker not in self.generators:
+			if not self.silence:
+				six.print_( "Now building a Markov graph for character", speaker, "..." )
+			newGenerator = Generator( charLabel = speaker, cm = self.commentMark, randomizeCapitals = self.randomizeCapitals )
+			newGenerator.buildGraph( self.inDir )
 			
 			if not self.silence:
-				six.print_( "wordBubbleFileName:", wordBubbleFileName )
+				newGenerator.showStats()
 			
+			self.generators[ speaker ] = newGenerator
+		return self.generators[ speaker ]
+
+	def buildAllGenerators( self ):
+		'''Build the Markov graph for every character in every word bubble file generateComics() might pick. This gets called before forking worker processes, so that the workers all inherit the graphs rather than each building their own.
+		'''
+		if self.commandLineComicID is None:
+			wordBubbleFileNames = self.wordBubbleFileNames
+		else:
+			wordBubbleFileNames = [ self.commandLineComicID + ".tsv" ]
+		
+		for wordBubbleFileName in wordBubbleFileNames:
+			wordBubbleFileName = os.path.join( self.wordBubblesDir, wordBubbleFileName )
+			try:
+				with open( wordBubbleFileName, mode="rt" ) as wordBubbleFile:
+					if not idChecker.checkFile( wordBubbleFile, wordBubbleFileName, self.commentMark ):
+						continue #generateComic() reports this if the file gets picked
+					
+					for line in wordBubbleFile: #The first non-blank line after the ID lists the speakers
+						line = line.split( self.commentMark, 1 )[ 0 ].strip()
+						if len( line ) > 0:
+							for speaker in line.upper().split( "\t" ):
+								self.getGenerator( speaker )
+							break
+			except IOError: #Likewise
+				continue
+
+	def generateComic( self, generatedComicNumber ):
+		'''Generate one comic, save it, and upload it to any blogs.
+			Args:
+				generatedComicNumber: Which comic this is, counting from 0. Used in the output file names when generating more than one comic.
+			Returns:
+				The finished image.
+		'''
+		try:
 			if self.commandLineComicID is None:
-				comicID = os.path.splitext( wordBubbleFileName )[ 0 ]
+				wordBubbleFileName = random.choice( self.wordBubbleFileNames )
 			else:
-				comicID = self.commandLineComicID
-			wordBubbleFileName = os.path.join( self.wordBubblesDir, wordBubbleFileName )
-			if not self.silence:
-				six.print_( "Loading word bubbles from", wordBubbleFileName )
+				wordBubbleFileName = self.commandLineComicID + ".tsv"
+		except IndexError as error:
+			six.print_( error, file=sys.stderr )
+			sys.exit( EX_NOINPUT )
+		
+		if not self.silence:
+			six.print_( "wordBubbleFileName:", wordBubbleFileName )
+		
+		if self.commandLineComicID is None:
+			comicID = os.path.splitext( wordBubbleFileName )[ 0 ]
+		else:
+			comicID = self.commandLineComicID
+		wordBubbleFileName = os.path.join( self.wordBubblesDir, wordBubbleFileName ) #The only place the directory gets joined on, whichever way the file was picked
+		if not self.silence:
+			six.print_( "Loading word bubbles from", wordBubbleFileName )
 
-			try:
-				wordBubbleFile = open( wordBubbleFileName, mode="rt" )
-			except OSError as error:
-				six.print_( error, file=sys.stderr )
-				exit( EX_NOINPUT )
-			
-			if not idChecker.checkFile( wordBubbleFile, wordBubbleFileName, self.commentMark ):
-				six.print_( "Error: Word bubble file", wordBubbleFileName, "is not in the correct format." )
-				exit( EX_DATAERR )
-			
-			lookForSpeakers = True
-			speakers = []
-			while lookForSpeakers:
-				line = wordBubbleFile.readline()
-				if len( line ) > 0:
-					line = line.partition( self.commentMark )[0].strip()
-					if len( line ) > 0:
-						speakers = line.upper().split( "\t" )
-						if len( speakers ) > 0:
-							lookForSpeakers = False
-				else:
-					lookForSpeakers = False; #End of file reached, no speakers found
+		try:
+			wordBubbleFile = open( wordBubbleFileName, mode="rt" )
+		except OSError as error:
+			six.print_( error, file=sys.stderr )
+			sys.exit( EX_NOINPUT )
+		
+		if not idChecker.checkFile( wordBubbleFile, wordBubbleFileName, self.commentMark ):
+			six.print_( "Error: Word bubble file", wordBubbleFileName, "is not in the correct format." )
+			sys.exit( EX_DATAERR )
+		
+		#Read the rest of the file in one go. After the comments are stripped, the first non-blank line lists the speakers and every other one is a word bubble.
+		lines = [ line.split( self.commentMark, 1 )[ 0 ].strip() for line in wordBubbleFile ]
+		wordBubbleFile.close()
+		lines = [ line for line in lines if len( line ) > 0 ]
+		
+		speakers = []
+		if len( lines ) > 0:
+			speakers = lines[ 0 ].upper().split( "\t" )
+		
+		if len( speakers ) == 0:
+			six.print_( "Error: Word bubble file", wordBubbleFileName, "contains no speakers." )
+			sys.exit( EX_DATAERR )
+		
+		if not self.silence:
+			six.print_( "These characters speak:", speakers )
+		
+		for speaker in speakers:
+			self.getGenerator( speaker ) #Build any graphs we don't have yet before starting on the image
+		
+		if not self.silence:
+			six.print_( comicID )
+		
+		inImageFileName = os.path.join( self.imageDir, comicID + ".png" )
+		
+		try:
+			image = Image.open( inImageFileName ).convert() #Text rendering looks better if we ensure the image's mode is not palette-based. Calling convert() with no mode argument does this.
+		except IOError as error:
+			six.print_( error, file=sys.stderr )
+			sys.exit( EX_NOINPUT )
+		
+		draw = ImageDraw.Draw( image )
+		bandMax, useIntegers, useFloats = self.modeInfo( image ) #Every bubble is part of this image, so they all share its mode
+		
+		transcript = str( comicID ) + "\n"
+		
+		bubbles = OrderedDict() #Maps each box to the characters speaking in it. When two characters share a speech bubble, we don't generate text twice.
+		
+		#Nothing in these files is quoted, so quote marks are left alone.
+		rows = csv.reader( lines[ 1: ], delimiter = "\t", quoting = csv.QUOTE_NONE )
+		for line in rows:
+			if len( line ) > 0:
+				character = line[ 0 ].rstrip( ":" ).strip().upper()
+				
+				if character not in speakers:
+					six.print_( "Error: Word bubble file", wordBubbleFileName, "does not list", character, "in its list of speakers.", file=sys.stderr )
+					sys.exit( EX_DATAERR )
+				
+				try:
+					box = tuple( [ int( coordinate ) for coordinate in line[ 1:5 ] ] )
+					topLeftX, topLeftY, bottomRightX, bottomRightY = box #Make sure there are four
+				except ValueError:
+					six.print_( "Error: Word bubble file", wordBubbleFileName, "has a line for", character, "without four valid coordinates:", line[ 1: ], file=sys.stderr )
+					sys.exit( EX_DATAERR )
+				
+				bubbles.setdefault( box, [] ).append( character )
+		
+		#The first character listed for a shared bubble does the talking. Generate all of each character's sentences with one call, then hand them out in bubble order.
+		sentenceCounts = OrderedDict()
+		for characters in bubbles.values():
+			sentenceCounts[ characters[ 0 ] ] = sentenceCounts.get( characters[ 0 ], 0 ) + 1
+		sentences = dict()
+		for character, count in sentenceCounts.items():
+			sentences[ character ] = iter( self.getGenerator( character ).generateSentences( count ) )
+		
+		for box, characters in bubbles.items():
+			character = characters[ 0 ]
+			topLeftX, topLeftY, bottomRightX, bottomRightY = box
 			
-			if len( speakers ) == 0:
-				six.print_( "Error: Word bubble file", wordBubbleFileName, "contains no speakers." )
-				exit( EX_DATAERR )
+			nodeList = next( sentences[ character ] )
 			
+			oneCharacterTranscript = character + ": "
+			oneCharacterTranscript += self.stringFromNodes( nodeList )
 			if not self.silence:
-				six.print_( "These characters speak:", speakers )
+				six.print_( oneCharacterTranscript )
+			oneCharacterTranscript += "\n"
+			transcript += oneCharacterTranscript
 			
-			for speaker in speakers:
-				if speaker not in self.generators:
-					if not self.silence:
-						six.print_( "Now building a Markov graph for character", speaker, "..." )
-					newGenerator = Generator( charLabel = speaker, cm = self.commentMark, randomizeCapitals = self.randomizeCapitals )
-					newGenerator.buildGraph( self.inDir )
-					
-					if not self.silence:
-						newGenerator.showStats()
-					
-					self.generators[ speaker ] = newGenerator
+			width = bottomRightX - topLeftX
+			if width <= 0: #Width must be positive
+				width = 1
+			height = bottomRightY - topLeftY
+			if height <= 0:
+				height = 1
 			
-			if not self.silence:
-				six.print_( comicID )
+			size = int( height * 1.2 ) #Contrary to the claim by PIL's documentation, font sizes are apparently in pixels, not points. The size being requested is the height of a generic character; the actual height of any particular character will be approximately (not exactly) the requested size. This is the largest size we will try. The 1.2, used to account for the fact that real character sizes aren't exactly the same as the requested size, I just guessed an appropriate value.
 			
-			inImageFileName = os.path.join( self.imageDir, comicID + ".png" )
+			largestSize = size
+			size = self.estimateLargestSize( nodeList, largestSize, width, height )
+			#Check the estimate with real measurements. Step away from it in ever-doubling steps until the largest size that fits is bracketed, then binary search the bracket.
+			fitting = 1 #The largest size known to fit. If nothing fits, size 1 is what we settle for.
+			tooBig = largestSize + 1 #The smallest size known not to fit
+			step = 1
+			if self.fitsAtSize( nodeList, size, width, height ):
+				fitting = size
+				while fitting < tooBig - 1:
+					candidate = min( fitting + step, tooBig - 1 )
+					if self.fitsAtSize( nodeList, candidate, width, height ):
+						fitting = candidate
+						step *= 2
+					else:
+						tooBig = candidate
+			else:
+				tooBig = size
+				while tooBig > fitting + 1:
+					candidate = max( tooBig - step, fitting + 1 )
+					if self.fitsAtSize( nodeList, candidate, width, height ):
+						fitting = candidate
+						break
+					tooBig = candidate
+					step *= 2
 			
-			try:
-				image = Image.open( inImageFileName ).convert() #Text rendering looks better if we ensure the image's mode is not palette-based. Calling convert() with no mode argument does this.
-			except IOError as error:
-				six.print_( error, file=sys.stderr )
-				exit( EX_NOINPUT )
+			while tooBig - fitting > 1:
+				size = ( fitting + tooBig ) // 2
+				if self.fitsAtSize( nodeList, size, width, height ):
+					fitting = size
+				else:
+					tooBig = size
 			
-			transcript = str( comicID ) + "\n"
+			size = fitting
+			normalFont, boldFont, listoflists = self.wrapAtSize( nodeList, size, width ) #Also sets the nodes' fonts back to this size
 			
-			previousBox = ( int( -1 ), int( -1 ), int( -1 ), int( -1 ) ) #For detecting when two characters share a speech bubble; don't generate text twice.
+			margin = topLeftX #Coordinates are relative to the whole image, not the bubble
+			offset = originalOffset = topLeftY
 			
-			for line in wordBubbleFile:
-				line = line.partition( self.commentMark )[ 0 ].strip()
+			try: #Choose a text color that will be visible against the background
+				backgroundColor = self.averageColor( image, box ) #The average of the whole bubble, so that one stray pixel (such as part of the bubble's outline) can't make the text invisible
+				textColorList = []
 				
-				if len( line ) > 0:
-					line = line.split( "\t" )
-					character = line[ 0 ].rstrip( ":" ).strip().upper()
-					
-					try:
-						generator = self.generators[ character ]
-					except:
-						six.print_( "Error: Word bubble file", wordBubbleFileName, "does not list", character, "in its list of speakers.", file=sys.stderr )
-						exit( EX_DATAERR )
+				for c in backgroundColor:
+					d = bandMax - ( c * 1.5 )
 					
-					topLeftX = int( line[ 1 ] )
-					topLeftY = int( line[ 2 ] )
-					bottomRightX = int( line[ 3 ] )
-					bottomRightY = int( line[ 4 ] )
+					if d < 0:
+						d = 0
 					
-					box = ( topLeftX, topLeftY, bottomRightX, bottomRightY )
+					if useIntegers:
+						d = int( d )
+					elif useFloats:
+						d = float( d )
 					
-					if box != previousBox:
-						previousBox = box
-						
-						text = ""
-						nodeList = generator.generateSentences( 1 )[ 0 ]
-						for node in nodeList:
-							text += node.word + " "
-						text.rstrip()
-						
-						oneCharacterTranscript = character + ": "
-						oneCharacterTranscript += self.stringFromNodes( nodeList )
-						if not self.silence:
-							six.print_( oneCharacterTranscript )
-						oneCharacterTranscript += "\n"
-						transcript += oneCharacterTranscript
-						
-						wordBubble = image.crop( box )
-						draw = ImageDraw.Draw( wordBubble )
-						
-						width = bottomRightX - topLeftX
-						if width <= 0: #Width must be positive
-							width = 1
-						height = bottomRightY - topLeftY
-						if height <= 0:
-							height = 1
-						
-						size = int( height * 1.2 ) #Contrary to the claim by PIL's documentation, font sizes are apparently in pixels, not points. The size being requested is the height of a generic character; the actual height of any particular character will be approximately (not exactly) the requested size. We will try smaller and smaller sizes in the while loop below. The 1.2, used to account for the fact that real character sizes aren't exactly the same as the requested size, I just guessed an appropriate value.
-						
-						normalFont = ImageFont.truetype( self.normalFontFile, size = size )
-						boldFont = ImageFont.truetype( self.boldFontFile, size = size )
-						
-						listoflists = self.rewrap_nodelistlist( nodeList, normalFont, boldFont, width, fontSize = size )
-						
-						margin = 0
-						offset = originalOffset = 0
-						goodSizeFound = False
-						
-						while not goodSizeFound:
-							goodSizeFound = True
-							totalHeight = 0
-							for line in listoflists:
-								
-								lineWidth = 0
-								lineHeight = 0
-								for node in line:
-									wordSize = normalFont.getsize( node.word + " " )
-									lineWidth += wordSize[ 0 ]
-									lineHeight = max( lineHeight, wordSize[ 1 ] )
-								lineWidth -= normalFont.getsize( " " )[ 0 ]
-								totalHeight += lineHeight
-								if lineWidth > width:
-									goodSizeFound = False
-							
-							if totalHeight > height:
-								goodSizeFound = False
-							
-							if not goodSizeFound:
-								size -= 1
-								try:
-									normalFont = ImageFont.truetype( self.normalFontFile, size = size )
-									boldFont = ImageFont.truetype( self.boldFontFile, size = size )
-								except IOError as error:
-									six.print_( error, "\nUsing default font instead.", file=sys.stderr )
-									normalFont = ImageFont.load_default()
-									boldFont = ImageFont.load_default()
-								listoflists = self.rewrap_nodelistlist( nodeList, normalFont, boldFont, width, fontSize = size )
-						
-						midX = int( wordBubble.size[ 0 ] / 2 )
-						midY = int( wordBubble.size[ 1 ] / 2 )
-						
-						try: #Choose a text color that will be visible against the background
-							backgroundColor = ImageStat.Stat( wordBubble ).mean #wordBubble.getpixel( ( midX, midY ) )
-							textColorList = []
-							
-							useIntegers = False
-							useFloats = False
-							if wordBubble.mode.startswith( "1" ):
-								bandMax = 1
-								useIntegers = True
-							elif wordBubble.mode.startswith( "L" ) or wordBubble.mode.startswith( "P" ) or wordBubble.mode.startswith( "RGB" ) or wordBubble.mode.startswith( "CMYK" ) or wordBubble.mode.startswith( "YCbCr" ) or wordBubble.mode.startswith( "LAB" ) or wordBubble.mode.startswith( "HSV" ):
-								bandMax = 255
-								useIntegers = True
-							elif wordBubble.mode.startswith( "I" ):
-								bandMax = 2147483647 #max for a 32-bit signed integer
-								useIntegers = True
-							elif wordBubble.mode.startswith( "F" ):
-								bandMax = float( "infinity" )
-								useFloats = True
-							else: #I've added all modes currently supported according to Pillow documentation; this is for future compatibility
-								bandMax = max( ImageStat.Stat( image ).extrema )
-							
-							for c in backgroundColor:
-								d = bandMax - ( c * 1.5 )
-								
-								if d < 0:
-									d = 0
-								
-								if useIntegers:
-									d = int( d )
-								elif useFloats:
-									d = float( d )
-								
-								textColorList.append( d )
-							
-							if wordBubble.mode.endswith( "A" ): #Pillow supports two modes with alpha channels
-								textColorList[ -1 ] = bandMax
-							
-							textColor = tuple( textColorList )
-							
-						except ValueError:
-							textColor = "black"
-						
-						offset = originalOffset
-						for line in listoflists:
-							xOffset = 0
-							yOffsetAdditional = 0
-							for node in line:
-								usedFont = node.font
-								draw.text( ( margin + xOffset, offset ), node.word + " ", font = usedFont, fill = textColor )
-								tempSize = usedFont.getsize( node.word + " " )
-								xOffset += tempSize[ 0 ]
-								yOffsetAdditional = max( yOffsetAdditional, tempSize[ 1 ] )
-								node.unselectStyle()
-							offset += yOffsetAdditional
-						
-						image.paste( wordBubble, box )
-						
-			wordBubbleFile.close()
-			
-			if self.numberOfComics > 1:
-				oldOutTextFileName = self.outTextFileName
-				temp = os.path.splitext(self.outTextFileName )
-				self.outTextFileName = temp[ 0 ] + str( self.generatedComicNumber ) + temp[ 1 ]
-			
-			#---------------------------Split into separate function
-			try:
-				#os.makedirs( os.path.dirname( outTextFileName ), exist_ok = True )
-				outFile = open( self.outTextFileName, mode="wt" )
-			except OSError as error:
-				six.print_( error, "\nUsing standard output instead", file=sys.stderr )
-				outFile = sys.stdout
-			
-			if self.numberOfComics > 1:
-				self.outTextFileName = oldOutTextFileName
-			
-			six.print_( transcript, file=outFile )
-			
-			outFile.close()
-			
-			if self.numberOfComics > 1:
-				oldOutImageFileName = self.outImageFileName
-				temp = os.path.splitext( self.outImageFileName )
-				outImageFileName = temp[ 0 ] + str( self.generatedComicNumber ) + temp[ 1 ]
-			
-			if self.topImageFileName != None:
-				try:
-					topImage = Image.open( self.topImageFileName ).convert( mode=image.mode )
-				except IOError as error:
-					six.print_( error, file=sys.stderr )
-					exit( EX_NOINPUT )
-				oldSize = topImage.size
-				size = ( max( topImage.size[ 0 ], image.size[ 0 ] ), topImage.size[ 1 ] + image.size[ 1 ] )
+					textColorList.append( d )
 				
-				newImage = Image.new( mode=image.mode, size=size )
-				newImage.paste( im=topImage, box=( 0, 0 ) )
-				newImage.paste( im=image, box=( 0, oldSize[ 1 ] ) )
-				image = newImage
-			
-			
-			
-			originalURL = None
-			URLFile = open( os.path.join( self.inDir, "sources.tsv" ), "rt" )
-			for line in URLFile:
-				line = line.partition( self.commentMark )[ 0 ].strip()
+				if image.mode.endswith( "A" ): #Pillow supports two modes with alpha channels
+					textColorList[ -1 ] = bandMax
 				
-				if len( line ) > 0:
-					line = line.split( "\t" )
-					
-					if comicID == line[ 0 ]:
-						originalURL = line[ 1 ]
-						break;
-			URLFile.close()
-			
-			transcriptWithURL = transcript + "\n" + originalURL #The transcript that gets embedded into the image file should include the URL. The transcript that gets uploaded to blogs doesn't need it, as the URL gets sent anyway.
-			
-			infoToSave = PngInfo()
-			
-			encodingErrors = "backslashreplace" #If we encounter errors during text encoding, I feel it best to replace unencodable text with escape sequences; that way it may be possible for reader programs to recover the original unencodable text.
-			
-			#According to the Pillow documentation, key names should be "latin-1 encodable". I take this to mean that we ourselves don't need to encode it in latin-1.
-			key = "transcript"
-			keyUTF8 = key.encode( "utf-8", errors=encodingErrors )
-			
-			#uncomment the following if using Python 3
-			#transcriptISO = transcriptWithURL.encode( "iso-8859-1", errors=encodingErrors )
-			#transcriptUTF8 = transcriptWithURL.encode( "utf-8", errors=encodingErrors )
-			
-			#python 2:
-			tempencode = transcriptWithURL.decode( 'ascii', errors='replace' ) # I really don't like using this ascii-encoded intermediary called tempencode, but i couldn't get the program to work when encoding directly to latin-1
-			transcriptISO = tempencode.encode( "iso-8859-1", errors='replace' )
-			transcriptUTF8 = tempencode.encode( "utf-8", errors='replace' )
-			
-			
-			infoToSave.add_itxt( key=key, value=transcriptUTF8, tkey=keyUTF8 )
-			infoToSave.add_text( key=key, value=transcriptISO )
+				textColor = tuple( textColorList )
+				
+			except ValueError:
+				textColor = "black"
 			
-			#GIMP only recognizes comments
-			key = "Comment"
-			keyUTF8 = key.encode( "utf-8", errors=encodingErrors )
+			offset = originalOffset
+			lineHeight = self.lineHeight( normalFont )
+			for line in listoflists:
+				xOffset = 0
+				for usedFont, run in itertools.groupby( line, lambda node: node.font ): #Each run of words in the same font gets drawn at once; usually that's the whole line
+					runText = "".join( [ node.word + " " for node in run ] )
+					draw.text( ( margin + xOffset, offset ), runText, font = usedFont, fill = textColor )
+					xOffset += self.textWidth( usedFont, runText )
+				
+				for node in line:
+					node.unselectStyle()
+				offset += lineHeight
 			
-			infoToSave.add_text( key=key, value=transcriptISO )
-			infoToSave.add_itxt( key=key, value=transcriptUTF8, tkey=keyUTF8 )
+		#---------------------------Split into separate function
+		try:
+			#os.makedirs( os.path.dirname( outTextFileName ), exist_ok = True )
+			outFile = open( self.numberedFileName( self.outTextFileName, generatedComicNumber ), mode="wt" )
+		except OSError as error:
+			six.print_( error, "\nUsing standard output instead", file=sys.stderr )
+			outFile = sys.stdout
+		
+		six.print_( transcript, file=outFile )
+		
+		outFile.close()
+		
+		outImageFileName = self.numberedFileName( self.outImageFileName, generatedComicNumber )
+		
+		if self.topImageFileName != None:
+			topImage = self.getTopImage( image.mode )
+			oldSize = topImage.size
+			size = ( max( topImage.size[ 0 ], image.size[ 0 ] ), topImage.size[ 1 ] + image.size[ 1 ] )
 			
+			fillColor = 0
+			if topImage.size[ 0 ] == image.size[ 0 ]:
+				fillColor = None #The two pastes cover every pixel, so don't spend a pass filling the new image first
+			newImage = Image.new( mode=image.mode, size=size, color=fillColor )
+			newImage.paste( im=topImage, box=( 0, 0 ) )
+			newImage.paste( im=image, box=( 0, oldSize[ 1 ] ) )
+			image = newImage
+		
+		
+		
+		originalURL = self.getOriginalURL( comicID )
+		
+		transcriptWithURL = transcript
+		if originalURL is not None:
+			transcriptWithURL += "\n" + originalURL #The transcript that gets embedded into the image file should include the URL. The transcript that gets uploaded to blogs doesn't need it, as the URL gets sent anyway.
+		
+		infoToSave = PngInfo()
+		
+		encodingErrors = "backslashreplace" #If we encounter errors during text encoding, I feel it best to replace unencodable text with escape sequences; that way it may be possible for reader programs to recover the original unencodable text.
+		
+		transcriptISO = None
+		if isinstance( transcriptWithURL, bytes ): #Python 2 reads files as bytes; the transcripts are UTF-8
 			try:
-				#os.makedirs( os.path.dirname( outImageFileName ), exist_ok = True )
-				if self.saveForWeb:
-					image = image.convert( mode = "P", palette="ADAPTIVE", dither=False ) #Try turning dithering on or off.
-					image.save( self.outImageFileName, format="PNG", optimize=True, pnginfo=infoToSave )
-				else:
-					image.save( self.outImageFileName, format="PNG", pnginfo=infoToSave )
-			except IOError as error:
-				six.print_( error, file = sys.stderr )
-				exit( EX_CANTCREAT )
-			except OSError as error:
-				six.print_( error, file = sys.stderr )
-				exit( EX_CANTCREAT )
+				transcriptWithURL.decode( "ascii" )
+			except UnicodeDecodeError:
+				transcriptWithURL = transcriptWithURL.decode( "utf-8", errors="replace" )
+			else:
+				transcriptISO = transcriptWithURL #ASCII bytes are already valid Latin-1, so there's no need to decode them only to encode them again
+		
+		if transcriptISO is None:
+			try:
+				transcriptISO = transcriptWithURL.encode( "iso-8859-1" ) #Latin-1 maps each character straight to one byte, which makes it the cheapest encoding there is, and it covers nearly every transcript
+			except UnicodeEncodeError:
+				pass
+		
+		#Each key gets one chunk, not two holding the same transcript: tEXt when the transcript fits in Latin-1 (which is all tEXt can hold, and which every reader understands), iTXt otherwise.
+		#According to the Pillow documentation, key names should be "latin-1 encodable". I take this to mean that we ourselves don't need to encode it in latin-1.
+		if transcriptISO is not None:
+			for key, keyUTF8 in PNG_TRANSCRIPT_KEYS:
+				infoToSave.add_text( key=key, value=transcriptISO )
+		else:
+			transcriptUTF8 = transcriptWithURL.encode( "utf-8", errors=encodingErrors )
+			for key, keyUTF8 in PNG_TRANSCRIPT_KEYS:
+				infoToSave.add_itxt( key=key, value=transcriptUTF8, tkey=keyUTF8 )
+		
+		try:
+			#os.makedirs( os.path.dirname( outImageFileName ), exist_ok = True )
+			if self.saveForWeb:
+				image = quantizeForWeb( image )
 			
+			imageBuffer = io.BytesIO() #Pillow writes a PNG in lots of little pieces, so collect them in memory and write the file in one go
+			imageData = None
+			if self.saveForWeb and self.optimizePNG and self.oxipng is not None:
+				image.save( imageBuffer, format="PNG", compress_level=1, pnginfo=infoToSave ) #oxipng recompresses everything anyway, so don't spend time compressing well here
+				imageData = self.optimizeWithOxipng( imageBuffer.getvalue() )
+				imageBuffer = io.BytesIO()
+			if imageData is None:
+				if self.saveForWeb and self.optimizePNG:
+					image.save( imageBuffer, format="PNG", optimize=True, pnginfo=infoToSave )
+				else:
+					image.save( imageBuffer, format="PNG", compress_level=self.compressLevel, pnginfo=infoToSave )
+				imageData = imageBuffer.getvalue()
+			with open( outImageFileName, "wb" ) as outImageFile:
+				outImageFile.write( imageData )
+		except ( IOError, OSError ) as error: #The same thing in Python 3, but not in Python 2
+			six.print_( error, file = sys.stderr )
+			sys.exit( EX_CANTCREAT )
+		
+		if not self.silence:
+			six.print_( "Original comic URL:", originalURL )
+		
+		for blogNumber, blog in enumerate( self.blogUploaders ):
+			uploadArguments = dict( postStatus = "publish", inputFileName = outImageFileName, shortComicTitle = self.shortName, longComicTitle = self.longName, transcript = transcript, originalURL = originalURL, silence = self.silence )
+			if self.uploadExecutors is not None: #Uploading waits on the network, so let it happen while the next comic is generated
+				self.uploads.append( self.uploadExecutors[ blogNumber ].submit( blog.upload, **uploadArguments ) )
+			else:
+				blog.upload( **uploadArguments )
+		
+		return image
+
+	def optimizeWithOxipng( self, imageData ):
+		'''Shrink a PNG using oxipng.
+			Args:
+				imageData: The PNG file's contents, as bytes.
+			Returns:
+				The optimized PNG as bytes, or None if oxipng failed.
+		'''
+		try:
+			process = subprocess.Popen( [ self.oxipng, "--opt", "4", "--quiet", "--stdout", "-" ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+			optimizedData, errors = process.communicate( imageData )
+		except OSError as error:
+			six.print_( "Could not run oxipng, using Pillow instead:", error, file=sys.stderr )
+			self.oxipng = None #Don't keep trying
+			return None
+		if process.returncode != 0 or len( optimizedData ) == 0:
+			six.print_( "oxipng failed, using Pillow instead:", errors.decode( "utf-8", "replace" ).strip(), file=sys.stderr )
+			return None
+		return optimizedData
+
+	def makeWorkerPool( self ):
+		'''Make a pool of processes for generating comics in parallel.
+			Returns:
+				A multiprocessing.Pool, or None if one can't be made here.
+		'''
+		if multiprocessing is None:
+			return None
+		try:
+			context = multiprocessing.get_context( "fork" ) #The workers need to inherit this app, which only forking does
+		except AttributeError: #Python 2 has no get_context(); it forks on everything but Windows
+			if os.name == "nt":
+				return None
+			context = multiprocessing
+		except ValueError: #Forking isn't available on Windows
+			return None
+		global workerApp
+		workerApp = self #Must be set before the pool forks its workers
+		try:
+			#Each worker reseeds the random number generator; otherwise they'd all inherit the same state and generate the same comic.
+			return context.Pool( processes = min( self.numberOfComics, context.cpu_count() ), initializer = random.seed )
+		except ( ImportError, OSError, NotImplementedError ) as error: #e.g. no working sem_open()
 			if not self.silence:
-				six.print_( "Original comic URL:", originalURL )
-			
-			for blog in self.blogUploaders:
-				blog.upload( postStatus = "publish", inputFileName = outImageFileName, shortComicTitle = self.shortName, longComicTitle = self.longName, transcript = transcript, originalURL = originalURL, silence = self.silence )
-			
-			if self.numberOfComics > 1:
-				outImageFileName = oldOutImageFileName
-		#end of loop: for generatedComicNumber in range( numberOfComics ):
+				six.print_( "Could not start worker processes, generating comics one at a time:", error )
+			return None
+	
+	def generateComics( self, instance = None ):
+		'''Generate numberOfComics comics and, if there's a GUI, display the last one.
+			Args:
+				instance: The widget which triggered this, if any. Ignored.
+		'''
+		if self.commandLineComicID is None:
+			self.wordBubbleFileNames = os.listdir( self.wordBubblesDir ) #Read the directory once rather than once per comic
+		
+		image = Image.new( mode="1", size=(0, 0) )
+		
+		pool = None
+		if self.noGUI and self.numberOfComics > 1:
+			#Do the work every comic shares once here, so the workers all inherit it rather than each doing it themselves
+			if self.originalURLs is None:
+				self.loadOriginalURLs()
+			self.buildAllGenerators()
+			pool = self.makeWorkerPool()
+		
+		if pool is not None:
+			for status in pool.imap_unordered( generateComicInWorker, range( self.numberOfComics ) ): #Deal with each comic as soon as it's done, whatever order they finish in
+				if status != EX_OK:
+					pool.terminate() #No point finishing the rest
+					sys.exit( status )
+			pool.close()
+			pool.join()
+		else:
+			if ThreadPoolExecutor is not None and self.numberOfComics > 1 and len( self.blogUploaders ) > 0:
+				#Each uploader gets a thread of its own: an uploader's connection can't be shared between threads, and this keeps each blog's posts in order.
+				self.uploadExecutors = [ ThreadPoolExecutor( max_workers = 1 ) for blog in self.blogUploaders ]
+			try:
+				for generatedComicNumber in range( self.numberOfComics ):
+					image = self.generateComic( generatedComicNumber )
+			finally:
+				if self.uploadExecutors is not None:
+					for executor in self.uploadExecutors:
+						executor.shutdown( wait = True )
+					self.uploadExecutors = None
+			uploads = self.uploads
+			self.uploads = []
+			for upload in uploads:
+				upload.result() #Raises any exception the upload raised
 		
 		#---------------------------It's display time!
+		if self.noGUI:
+			return
 		if image.mode != "RGB":
 			image = image.convert( mode = "RGB" )
 		self.gui.comicArea.texture = Texture.create( size = image.size, colorfmt = 'rgb' )
 		self.gui.comicArea.texture.blit_buffer( pbuffer = image.transpose( Image.FLIP_TOP_BOTTOM ).tobytes(), colorfmt = 'rgb' )
 	
+	def modeInfo( self, image ):
+		'''Find the range and type of the values in an image's bands.
+			Args:
+				image: A PIL image.
+			Returns:
+				A tuple of the largest value a band can hold, a Boolean indicating whether band values are integers, and a Boolean indicating whether they are floats.
+		'''
+		useIntegers = False
+		useFloats = False
+		if image.mode.startswith( "1" ):
+			bandMax = 1
+			useIntegers = True
+		elif image.mode.startswith( ( "L", "P", "RGB", "CMYK", "YCbCr", "LAB", "HSV" ) ):
+			bandMax = 255
+			useIntegers = True
+		elif image.mode.startswith( "I" ):
+			bandMax = 2147483647 #max for a 32-bit signed integer
+			useIntegers = True
+		elif image.mode.startswith( "F" ):
+			bandMax = float( "infinity" )
+			useFloats = True
+		else: #I've added all modes currently supported according to Pillow documentation; this is for future compatibility
+			bandMax = max( [ extremes[ 1 ] for extremes in ImageStat.Stat( image ).extrema ] )
+		return bandMax, useIntegers, useFloats
+
+	def averageColor( self, image, box ):
+		'''Find the average color of part of an image.
+			Args:
+				image: A PIL image.
+				box: A tuple of the left, top, right, and bottom coordinates of the part to average.
+			Returns:
+				A sequence containing the mean of each band.
+		'''
+		if image.mode in [ "RGB", "L", "CMYK", "YCbCr", "LAB", "HSV" ]:
+			try:
+				#Shrinking the box to a single pixel with a box filter averages it in one pass, straight from the image without cropping out a copy first. ImageStat builds a histogram of every band first, and it's about half as fast. Modes with alpha are left to ImageStat, because resize() premultiplies them, which makes it slower rather than faster.
+				color = image.resize( ( 1, 1 ), Image.BOX, box = box ).getpixel( ( 0, 0 ) )
+			except ( AttributeError, TypeError ): #Image.BOX was added in Pillow 3.4, and resize()'s box argument in 4.3
+				pass
+			else:
+				if isinstance( color, tuple ):
+					return color
+				return ( color, )
+		return ImageStat.Stat( image.crop( box ) ).mean
+
 	def runGUI( self ):
 		self.run()
 
@@ -743,5 +1410,5 @@ if __name__ == "__main__":
 		m.generateComics()
 	else:
 		m.runGUI()
-
-exit( EX_OK )
+	
+	sys.exit( EX_OK )
@@ -0,0 +1,230 @@
+#!/usr/bin/python2
+# coding=utf-8
+
+import io
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from PIL import Image, ImageFont
+
+import main
+from markovnode import MarkovNode
+
+class RemoveUnprintableTest( unittest.TestCase ):
+	def test_text( self ):
+		self.assertEqual( main.removeUnprintable( u"HEY\x00 YOU\x07!" ), u"HEY YOU!" )
+
+	def test_bytes( self ):
+		#Python 2 reads the transcripts as byte strings, whose translate() doesn't take a dictionary
+		result = main.removeUnprintable( b"HEY\x00 YOU\x07!" )
+		self.assertIsInstance( result, bytes )
+		self.assertEqual( result, b"HEY YOU!" )
+
+class QuantizeForWebTest( unittest.TestCase ):
+	def saveAndReload( self, image ):
+		imageBuffer = io.BytesIO()
+		main.quantizeForWeb( image ).save( imageBuffer, format="PNG" )
+		imageBuffer.seek( 0 )
+		return Image.open( imageBuffer )
+
+	def test_bilevel( self ):
+		image = Image.new( "1", ( 20, 10 ) )
+		image.paste( 1, ( 0, 0, 10, 10 ) )
+		saved = self.saveAndReload( image )
+		self.assertEqual( saved.mode, "P" )
+		self.assertEqual( saved.convert( "L" ).getextrema(), ( 0, 255 ) )
+
+	def test_alpha( self ):
+		image = Image.new( "LA", ( 20, 10 ), ( 50, 255 ) )
+		image.paste( ( 200, 0 ), ( 0, 0, 10, 10 ) )
+		saved = self.saveAndReload( image )
+		self.assertEqual( saved.mode, "P" )
+		self.assertEqual( saved.convert( "RGBA" ).getpixel( ( 15, 5 ) )[ 3 ], 255 )
+
+class LineBreakingTest( unittest.TestCase ):
+	@classmethod
+	def setUpClass( cls ):
+		os.chdir( os.path.dirname( os.path.abspath( __file__ ) ) ) #The app looks for its data relative to the current directory
+		cls.app = main.MarkovApp()
+		cls.app.silence = True
+
+	def cost( self, wordWidths, spaceWidth, maxWidth, breaks ):
+		'''The ( number of lines, raggedness ) of a layout, as breakLines() scores it, or None if a line is too wide.'''
+		raggedness = 0
+		ends = breaks[ 1: ] + [ len( wordWidths ) ]
+		for start, end in zip( breaks, ends ):
+			lineWidth = sum( wordWidths[ start:end ] ) + spaceWidth * ( end - start - 1 )
+			if lineWidth > maxWidth and end > start + 1:
+				return None
+			if end < len( wordWidths ):
+				raggedness += ( maxWidth - lineWidth ) ** 2
+		return ( len( breaks ), raggedness )
+
+	def randomCase( self, generator, maxWords ):
+		wordWidths = [ generator.randint( 1, 60 ) for word in range( generator.randint( 1, maxWords ) ) ]
+		return wordWidths, generator.randint( 1, 8 ), generator.randint( 30, 150 )
+
+	def test_empty( self ):
+		self.assertEqual( self.app.breakLines( [], 5, 100 ), [] )
+		self.assertEqual( self.app.countGreedyLines( [], 5, 100 ), 0 )
+
+	def test_overwide_words_get_a_line_each( self ):
+		self.assertEqual( self.app.breakLines( [ 10, 300, 10, 10, 400 ], 5, 100 ), [ 0, 1, 2, 4 ] )
+		self.assertEqual( self.app.countGreedyLines( [ 10, 300, 10, 10, 400 ], 5, 100 ), 4 )
+
+	def test_fewest_lines_is_the_greedy_count( self ):
+		generator = random.Random( 1 )
+		for case in range( 1000 ):
+			wordWidths, spaceWidth, maxWidth = self.randomCase( generator, 40 )
+			self.assertEqual( len( self.app.breakLines( wordWidths, spaceWidth, maxWidth ) ), self.app.countGreedyLines( wordWidths, spaceWidth, maxWidth ) )
+
+	def test_least_raggedness( self ):
+		#Try every possible set of line breaks on small inputs
+		generator = random.Random( 2 )
+		for case in range( 300 ):
+			wordWidths, spaceWidth, maxWidth = self.randomCase( generator, 8 )
+			best = None
+			for breakHere in itertools.product( [ False, True ], repeat = len( wordWidths ) - 1 ):
+				breaks = [ 0 ] + [ index + 1 for index, isBreak in enumerate( breakHere ) if isBreak ]
+				cost = self.cost( wordWidths, spaceWidth, maxWidth, breaks )
+				if cost is not None and ( best is None or cost < best ):
+					best = cost
+			breaks = self.app.breakLines( wordWidths, spaceWidth, maxWidth )
+			self.assertEqual( self.cost( wordWidths, spaceWidth, maxWidth, breaks ), best )
+
+	def nodes( self, text ):
+		return [ MarkovNode( word, word ) for word in text.split() ]
+
+	def test_estimate_is_close_to_the_largest_fitting_size( self ):
+		text = "THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG AND THEN IT GOES HOME TO HAVE A NAP"
+		for width, height in [ ( 300, 200 ), ( 120, 300 ), ( 500, 60 ) ]:
+			nodeList = self.nodes( text )
+			maxSize = int( height * 1.2 )
+			estimate = self.app.estimateLargestSize( nodeList, maxSize, width, height )
+			largestFitting = max( [ 1 ] + [ size for size in range( 1, maxSize + 1 ) if self.app.fitsAtSize( nodeList, size, width, height ) ] )
+			self.assertTrue( 1 <= estimate <= maxSize )
+			self.assertLessEqual( abs( estimate - largestFitting ), 2 )
+
+	def test_estimate_limits( self ):
+		self.assertEqual( self.app.estimateLargestSize( self.nodes( "HI" ), 40, 1000, 1000 ), 40 )
+		self.assertEqual( self.app.estimateLargestSize( self.nodes( "A FAR TOO LONG SENTENCE FOR THIS" ), 40, 2, 2 ), 1 )
+
+class OriginalURLTest( unittest.TestCase ):
+	@classmethod
+	def setUpClass( cls ):
+		os.chdir( os.path.dirname( os.path.abspath( __file__ ) ) ) #The app looks for its data relative to the current directory
+		cls.app = main.MarkovApp()
+
+	def setUp( self ):
+		self.app.inDir = tempfile.mkdtemp()
+		with open( os.path.join( self.app.inDir, "sources.tsv" ), "w" ) as sourcesFile:
+			sourcesFile.write( "}}ID\tURL\n" )
+			sourcesFile.write( "001\thttp://example.com/1\n" )
+			sourcesFile.write( "}}002\thttp://example.com/commented-out\n" )
+			sourcesFile.write( "003\thttp://example.com/003-and-002 }}not 002\n" )
+			sourcesFile.write( "  004\thttp://example.com/first-listing\n" )
+			sourcesFile.write( "004\thttp://example.com/second-listing\n" )
+			sourcesFile.write( "0050\thttp://example.com/50\n" )
+			sourcesFile.write( "005\thttp://example.com/5" ) #No newline at the end
+
+	def tearDown( self ):
+		shutil.rmtree( self.app.inDir )
+
+	def lookUp( self, comicID ):
+		'''Look a comic up both ways, check they agree, and return the URL.'''
+		found = self.app.findOriginalURL( comicID )
+		self.app.loadOriginalURLs()
+		self.assertEqual( found, self.app.originalURLs.get( comicID ) )
+		return found
+
+	def test_hit( self ):
+		self.assertEqual( self.lookUp( "001" ), "http://example.com/1" )
+		self.assertEqual( self.lookUp( "003" ), "http://example.com/003-and-002" )
+		self.assertEqual( self.lookUp( "005" ), "http://example.com/5" )
+
+	def test_miss( self ):
+		self.assertIsNone( self.lookUp( "999" ) )
+
+	def test_commented_line( self ):
+		self.assertIsNone( self.lookUp( "002" ) )
+
+	def test_duplicate_id( self ):
+		self.assertEqual( self.lookUp( "004" ), "http://example.com/first-listing" )
+
+	def test_missing_file( self ):
+		os.remove( os.path.join( self.app.inDir, "sources.tsv" ) )
+		self.assertIsNone( self.lookUp( "001" ) )
+
+class LineHeightTest( unittest.TestCase ):
+	def test_bitmap_font( self ):
+		#What ImageFont.load_default() gives without FreeType: a font with no getmetrics()
+		try:
+			font = ImageFont.load_default_imagefont()
+		except AttributeError: #Before Pillow 10.1, load_default() always gave the bitmap font
+			font = ImageFont.load_default()
+		os.chdir( os.path.dirname( os.path.abspath( __file__ ) ) ) #The app looks for its data relative to the current directory
+		app = main.MarkovApp()
+		self.assertGreater( app.lineHeight( font ), 0 )
+
+class StubUploader( object ):
+	'''Records uploads instead of sending them anywhere.'''
+	def __init__( self, error = None ):
+		self.uploads = []
+		self.error = error
+
+	def upload( self, inputFileName, **kwargs ):
+		self.uploads.append( ( os.path.basename( inputFileName ), threading.current_thread() ) )
+		if self.error is not None:
+			raise self.error
+
+class BackgroundUploadTest( unittest.TestCase ):
+	def setUp( self ):
+		os.chdir( os.path.dirname( os.path.abspath( __file__ ) ) ) #The app looks for its data relative to the current directory
+		self.outDir = tempfile.mkdtemp()
+		self.app = main.MarkovApp()
+		self.app.silence = True
+		self.app.noGUI = True
+		self.app.numberOfComics = 3
+		self.app.outTextFileName = os.path.join( self.outDir, "out.txt" )
+		self.app.outImageFileName = os.path.join( self.outDir, "out.png" )
+		self.app.makeWorkerPool = lambda: None #Generate the comics in this process, which is when uploads go to background threads
+
+	def tearDown( self ):
+		shutil.rmtree( self.outDir )
+
+	def test_uploads_in_order_off_the_main_thread( self ):
+		blogs = [ StubUploader(), StubUploader() ]
+		self.app.blogUploaders = blogs
+		self.app.generateComics()
+		for blog in blogs:
+			self.assertEqual( [ fileName for fileName, thread in blog.uploads ], [ "out0.png", "out1.png", "out2.png" ] )
+			for fileName, thread in blog.uploads:
+				self.assertIsNot( thread, threading.current_thread() )
+		self.assertIsNone( self.app.uploadExecutors )
+
+	def test_upload_errors_surface( self ):
+		self.app.blogUploaders = [ StubUploader( error = IOError( "connection refused" ) ) ]
+		self.assertRaises( IOError, self.app.generateComics )
+
+	def test_command_line_blog( self ):
+		sys_argv = main.sys.argv
+		main.sys.argv = [ "main.py", "-u", "http://localhost:1/xmlrpc.php", "-l", "name", "-a", "password" ]
+		try:
+			app = main.MarkovApp()
+			originalUploader = main.WordPressUploader
+			main.WordPressUploader = lambda uri, name, password: StubUploader()
+			try:
+				app.parseOptions()
+			finally:
+				main.WordPressUploader = originalUploader
+		finally:
+			main.sys.argv = sys_argv
+		self.assertEqual( len( app.blogUploaders ), 1 )
+
+if __name__ == "__main__":
+	unittest.main()